@@ -1,145 +1,469 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse
 import asyncio
-from typing import Dict, List
-from datetime import datetime
-import json
+import atexit
+import importlib.util
+from dataclasses import dataclass, field
+from functools import lru_cache
+from collections import deque
+from itertools import count, islice
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Set
+import logging
+import logging.handlers
 import os
+import queue
+import re
+import sys
+import time
+
+import msgpack
+import orjson
+
+# Wire formats. JSON is the default; clients opt into MessagePack by offering
+# the "msgpack" WebSocket subprotocol.
+JSON = "json"
+MSGPACK = "msgpack"
+
+# Each peer gets a bounded outbox drained by its own writer task, so a slow
+# peer only ever stalls itself. Overflowing the outbox or a stalled send drops the peer.
+OUTBOX_SIZE = 64
+# A full outbox sheds ICE candidates; a peer is only dropped after this many in a row
+# or when anything else does not fit.
+MAX_SHED_CANDIDATES = 3
+SEND_TIMEOUT = 2.0
 
 # Simple signaling server - star topology with host relay
-rooms: Dict[str, List[WebSocket]] = {}
-room_peer_ids: Dict[str, Dict[int, WebSocket]] = {}
-room_host: Dict[str, int] = {}
-next_peer_id: Dict[str, int] = {}
-room_lock = asyncio.Lock()
-server_start_time = datetime.now()
-connection_log: List[str] = []
-
-def log_event(message: str):
-    timestamp = datetime.now().strftime("%H:%M:%S")
+HOST_PEER_ID = 1
+
+@dataclass
+class PeerRecord:
+    """Everything the server tracks about one connected peer."""
+    peer_id: int
+    room_id: str
+    ws: WebSocket
+    codec: str = JSON
+    # Whether the peer accepts batch frames, and the ICE candidates held back for it.
+    batching: bool = False
+    pending_candidates: List[bytes] = None
+    outbox: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(OUTBOX_SIZE))
+    writer: asyncio.Task = None
+    dropped: bool = False
+    # The Room this peer joined, so relays skip the `rooms` lookup.
+    room: "Room" = field(default=None, repr=False)
+    shed_candidates: int = 0
+
+@dataclass
+class Room:
+    """A signaling room; `peers` maps peer ID to PeerRecord, the host being HOST_PEER_ID.
+
+    The host's wire format becomes the room's `codec`, so relays never need transcoding.
+    """
+    codec: str = JSON
+    peers: Dict[int, PeerRecord] = field(default_factory=dict)
+    # Clients are numbered from 2 and IDs are never reused.
+    peer_ids: Iterator[int] = field(default_factory=lambda: count(HOST_PEER_ID + 1))
+
+rooms: Dict[str, Room] = {}
+# Peers across all rooms, kept in step with `rooms` so /health need not walk them.
+total_connections = 0
+server_start_time = time.monotonic()  # monotonic, so uptime is immune to clock changes
+connection_log: Deque[str] = deque(maxlen=50)
+
+# Filtering only needs the "type" field, so sniff it from the head of the frame
+# instead of parsing payloads that may carry a whole SDP blob. The match is anchored
+# so "type" must be the object's first key; otherwise the frame is parsed.
+TYPE_RE = re.compile(rb'[ \t\r\n]*\{[ \t\r\n]*"type"[ \t\r\n]*:[ \t\r\n]*"([a-z_]+)"')
+# MessagePack equivalent: a map header, then the fixstr key "type" and a fixstr value.
+MSGPACK_TYPE_RE = re.compile(rb'(?:[\x80-\x8f]|\xde..|\xdf....)\xa4type([\xa0-\xbf])', re.DOTALL)
+# map16/map32 headers; smaller maps are fixmaps (0x80-0x8f).
+MSGPACK_MAP_HEADERS = b"\xde\xdf"
+JSON_WHITESPACE = b" \t\r\n"
+TYPE_SNIFF_BYTES = 128
+
+# Peers connecting with ?batch=1 get frames that queue up together coalesced into
+# {"type": "batch", "items": [...]}; ICE candidates, which arrive in bursts, are
+# additionally held back briefly so a burst lands in one batch.
+CANDIDATE_BATCH_WINDOW = 0.005
+CANDIDATE_BATCH_MAX = 16
+# Limits for one batch frame, so it fits the default inbound buffer of small clients
+# (e.g. 64 KiB in Godot's WebSocketPeer); whatever does not fit waits for the next write.
+BATCH_MAX_FRAMES = 16
+BATCH_MAX_BYTES = 16 * 1024
+MSGPACK_BATCH_PREFIX = b"\x82" + msgpack.packb("type") + msgpack.packb("batch") + msgpack.packb("items")
+_background_tasks: Set[asyncio.Task] = set()
+
+# Server settings used by __main__ (the Render entry point) and reported by /health.
+UVICORN_OPTIONS = {
+    # uvloop is not available on Windows; fall back to the stdlib loop there.
+    "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+    "http": "httptools",
+    "ws": "websockets",
+    # Signaling frames are small and compress poorly, so zlib would only cost
+    # CPU and a per-connection context (and invite compression bombs).
+    "ws_per_message_deflate": False,
+    # Ping every peer and close it if no pong arrives, so half-open sockets free their
+    # room slot. Liveness is checked this way rather than with a receive timeout,
+    # because a connected peer may legitimately stay silent for a long time.
+    "ws_ping_interval": 20.0,
+    "ws_ping_timeout": 20.0,
+}
+
+# Log lines are handed to a background thread so stdout writes never block the event loop.
+logger = logging.getLogger("signaling")
+# WS_VERBOSE=1 lowers the level to DEBUG for step-by-step bookkeeping logs.
+logger.setLevel(logging.DEBUG if os.environ.get("WS_VERBOSE") == "1" else logging.INFO)
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Debug logs are off by default: guarding them on this flag skips building
+# their f-strings (one lists every room) on every join.
+VERBOSE = logger.isEnabledFor(logging.DEBUG)
+
+_log_second = -1
+_log_timestamp = ""
+
+def log_timestamp() -> str:
+    """Return the local time as HH:MM:SS, formatting it at most once per second."""
+    global _log_second, _log_timestamp
+    now = int(time.time())
+    if now != _log_second:
+        _log_second = now
+        _log_timestamp = time.strftime("%H:%M:%S", time.localtime(now))
+    return _log_timestamp
+
+def log_event(message: str, level: int = logging.INFO):
+    timestamp = log_timestamp()
     log_entry = f"[{timestamp}] {message}"
-    print(log_entry)
+    logger.log(level, log_entry)
     connection_log.append(log_entry)
-    if len(connection_log) > 50:
-        connection_log.pop(0)
-
-async def add_client_to_room(room_id: str, websocket: WebSocket) -> (int, bool):
-    """Add client to room and return peer ID and is_host status."""
-    async with room_lock:
-        log_event(f"ADD_CLIENT: Entering for room {room_id}. Current rooms: {list(rooms.keys())}")
-        is_host = False
-        if room_id not in rooms:
-            log_event(f"ADD_CLIENT: Room {room_id} is new. Creating it.")
-            is_host = True
-            rooms[room_id] = []
-            room_peer_ids[room_id] = {}
-            next_peer_id[room_id] = 2
+
+def spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference and logging failures."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+def _background_task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log_event(f"⚠️ Background task failed: {task.exception()!r}", logging.ERROR)
+
+def add_client_to_room(room_id: str, websocket: WebSocket, codec: str = JSON, batching: bool = False) -> (PeerRecord, bool):
+    """Add client to room and return its PeerRecord and is_host status.
+
+    Runs without awaiting, so the membership update is atomic on the event loop.
+    The assigned ID is also stored on `websocket.state.peer_id`.
+    """
+    if VERBOSE:
+        log_event(f"ADD_CLIENT: Entering for room {room_id}. Current rooms: {list(rooms.keys())}", logging.DEBUG)
+    room = rooms.get(room_id)
+    is_host = room is None
+    if is_host:
+        if VERBOSE:
+            log_event(f"ADD_CLIENT: Room {room_id} is new. Creating it.", logging.DEBUG)
+        room = rooms[room_id] = Room(codec=codec)
+    elif VERBOSE:
+        log_event(f"ADD_CLIENT: Room {room_id} already exists.", logging.DEBUG)
+
+    if len(room.peers) >= 4:
+        log_event(f"Room {room_id} is full ({len(room.peers)}/4)")
+        return None, False
+
+    peer_id = HOST_PEER_ID if is_host else next(room.peer_ids)
+    if VERBOSE:
+        log_event(f"ADD_CLIENT: is_host={is_host}, assigned peer_id={peer_id}", logging.DEBUG)
+
+    global total_connections
+    peer = room.peers[peer_id] = PeerRecord(peer_id, room_id, websocket, codec, batching, room=room)
+    total_connections += 1
+    peer.writer = spawn(peer_writer(peer))
+    websocket.state.peer_id = peer_id
+
+    log_event(f"✅ Peer {peer_id} joined room {room_id} ({len(room.peers)}/4)")
+    return peer, is_host
+
+def enqueue(peer: PeerRecord, frame, candidate: bool = False):
+    """Queue a frame (str for text, bytes for binary) for a peer's writer.
+
+    A full outbox means the peer is not keeping up. ICE candidates are expendable,
+    so a few are shed first; otherwise the peer is dropped.
+    """
+    if peer.dropped:
+        return
+    try:
+        peer.outbox.put_nowait(frame)
+    except asyncio.QueueFull:
+        if candidate and peer.shed_candidates < MAX_SHED_CANDIDATES:
+            peer.shed_candidates += 1
+            return
+        peer.dropped = True
+        spawn(drop_peer(peer, "outbox full"))
+    else:
+        peer.shed_candidates = 0
+
+async def peer_writer(peer: PeerRecord):
+    """Send a peer's queued frames in order, dropping the peer if a send stalls.
+
+    For batching peers, frames that queued up meanwhile go out as one batch frame, up to
+    BATCH_MAX_FRAMES frames and BATCH_MAX_BYTES of payload. Relayed frames are not
+    validated, so only ones that look like objects are batched; anything else is sent alone.
+    """
+    websocket = peer.ws
+    outbox = peer.outbox
+    codec = peer.codec
+    held = None  # Taken from the outbox but not batchable with the last batch; sent next.
+    while True:
+        if held is not None:
+            frame, held = held, None
         else:
-            log_event(f"ADD_CLIENT: Room {room_id} already exists.")
-        
-        if len(rooms[room_id]) >= 4:
-            log_event(f"Room {room_id} is full ({len(rooms[room_id])}/4)")
-            return None, False
-        
-        peer_id = 1 if is_host else next_peer_id[room_id]
-        log_event(f"ADD_CLIENT: is_host={is_host}, assigned peer_id={peer_id}")
-        if not is_host:
-            next_peer_id[room_id] += 1
-        
-        if is_host:
-            room_host[room_id] = peer_id
+            frame = await outbox.get()
+        first = frame.encode() if isinstance(frame, str) else frame
+        if peer.batching and not outbox.empty() and is_object(first, codec):
+            items = [first]
+            size = len(first)
+            while len(items) < BATCH_MAX_FRAMES and not outbox.empty():
+                item = outbox.get_nowait()
+                data = item.encode() if isinstance(item, str) else item
+                if size + len(data) > BATCH_MAX_BYTES or not is_object(data, codec):
+                    held = item
+                    break
+                items.append(data)
+                size += len(data)
+            if len(items) > 1:
+                frame = encode_batch(items, codec)
+        send = websocket.send_text if isinstance(frame, str) else websocket.send_bytes
+        try:
+            await asyncio.wait_for(send(frame), SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            peer.dropped = True
+            spawn(drop_peer(peer, "send timed out"))
+            return
+        except Exception as e:
+            # The socket is gone; its receive loop takes care of the cleanup.
+            log_event(f"⚠️ Send to peer {peer.peer_id} in room {peer.room_id} failed: {e!r}", logging.WARNING)
+            return
 
-        # Notify existing peers
-        if not is_host:
-            msg = json.dumps({"type": "peer_joined", "peer_id": peer_id})
-            for client in rooms[room_id]:
-                try:
-                    await client.send_text(msg)
-                except:
-                    pass
-
-        rooms[room_id].append(websocket)
-        room_peer_ids[room_id][peer_id] = websocket
-        
-        log_event(f"✅ Peer {peer_id} joined room {room_id} ({len(rooms[room_id])}/4)")
-        return peer_id, is_host
+async def drop_peer(peer: PeerRecord, reason: str):
+    """Disconnect a peer that cannot keep up, so it stops holding a room slot."""
+    log_event(f"🐢 Dropping peer {peer.peer_id} in room {peer.room_id}: {reason}", logging.WARNING)
+    await remove_client_from_room(peer.room_id, peer.ws)
+    try:
+        await asyncio.wait_for(peer.ws.close(), SEND_TIMEOUT)
+    except Exception:
+        pass
+
+def broadcast_to_room(room_id: str, payload: bytes, exclude_client: WebSocket = None):
+    """Queue a pre-encoded payload for every client in a room except exclude_client.
+
+    The payload goes out as a binary frame so it is encoded once, not once per peer.
+    """
+    room = rooms.get(room_id)
+    if room is None:
+        return
+    for peer in room.peers.values():
+        if peer.ws is not exclude_client:
+            # Candidates held back for batching were relayed earlier, so they go first.
+            flush_candidates(peer)
+            enqueue(peer, payload)
+
+def encode(message: dict, codec: str) -> bytes:
+    """Serialize a server message in the given wire format."""
+    if codec == MSGPACK:
+        return msgpack.packb(message)
+    return orjson.dumps(message)
+
+def encode_frame(message: dict, codec: str):
+    """Serialize a message for a single client: a text frame for JSON, binary for MessagePack."""
+    if codec == MSGPACK:
+        return msgpack.packb(message)
+    return orjson.dumps(message).decode()
+
+# Same bytes orjson produces for the welcome dict; room_id is escaped with orjson.dumps.
+WELCOME_TEMPLATE = '{"type":"welcome","peer_id":%d,"room_id":%s,"is_host":%s}'
+
+def welcome_frame(peer_id: int, room_id: str, is_host: bool, codec: str):
+    """Serialize the welcome message, filling in the JSON template instead of building a dict."""
+    if codec == MSGPACK:
+        return msgpack.packb({"type": "welcome", "peer_id": peer_id, "room_id": room_id, "is_host": is_host})
+    return WELCOME_TEMPLATE % (peer_id, orjson.dumps(room_id).decode(), "true" if is_host else "false")
+
+@lru_cache(maxsize=256)
+def peer_notice(msg_type: str, peer_id: int, codec: str) -> bytes:
+    """Encoded peer_joined/peer_disconnected frame. These only vary by peer ID, so they are reused."""
+    return encode({"type": msg_type, "peer_id": peer_id}, codec)
+
+async def close_with_error(websocket: WebSocket, message: str, codec: str = JSON):
+    """Send an error message to a client and close its connection."""
+    frame = encode_frame({"type": "error", "message": message}, codec)
+    if isinstance(frame, str):
+        await websocket.send_text(frame)
+    else:
+        await websocket.send_bytes(frame)
+    await websocket.close()
 
 async def remove_client_from_room(room_id: str, websocket: WebSocket):
-    """Remove client from room."""
-    async with room_lock:
-        if room_id in rooms and websocket in rooms[room_id]:
-            peer_id_to_remove = None
-            for peer_id, ws in room_peer_ids[room_id].items():
-                if ws == websocket:
-                    peer_id_to_remove = peer_id
-                    break
-            
-            if peer_id_to_remove:
-                is_host_disconnecting = room_host.get(room_id) == peer_id_to_remove
-
-                rooms[room_id].remove(websocket)
-                del room_peer_ids[room_id][peer_id_to_remove]
-                log_event(f"❌ Peer {peer_id_to_remove} left room {room_id} ({len(rooms[room_id])}/4)")
-                
-                if is_host_disconnecting:
-                    log_event(f"Host {peer_id_to_remove} disconnected from room {room_id}. Closing room.")
-                    for client in rooms[room_id]:
-                        await client.send_text(json.dumps({"type": "error", "message": "Host disconnected"}))
-                        await client.close()
-                    del rooms[room_id]
-                    del room_peer_ids[room_id]
-                    del next_peer_id[room_id]
-                    del room_host[room_id]
-                    log_event(f"🧹 Room {room_id} deleted")
-                else:
-                    # Notify others
-                    if rooms[room_id]:
-                        msg = json.dumps({"type": "peer_disconnected", "peer_id": peer_id_to_remove})
-                        for client in rooms[room_id]:
-                            try:
-                                await client.send_text(msg)
-                            except:
-                                pass
-            
-            # Cleanup empty room
-            if room_id in rooms and not rooms[room_id]:
-                del rooms[room_id]
-                del room_peer_ids[room_id]
-                del next_peer_id[room_id]
-                if room_id in room_host:
-                    del room_host[room_id]
-                log_event(f"🧹 Room {room_id} deleted")
-
-async def relay_message(room_id: str, message: str, sender: WebSocket):
-    """Relay signaling messages between peers."""
-    async with room_lock:
-        if room_id in rooms:
-            data = json.loads(message)
-            from_peer_id = data.get("from_peer_id")
-            host_id = room_host.get(room_id)
-            
-            if not host_id:
-                log_event(f"Warning: No host found for room {room_id} during relay.")
-                return
-
-            if from_peer_id != host_id: # Message from a client
-                if host_id in room_peer_ids[room_id]:
-                    try:
-                        await room_peer_ids[room_id][host_id].send_text(message)
-                    except:
-                        pass
-            else: # Message from the host
-                for peer_id, client in room_peer_ids[room_id].items():
-                    if client != sender:
-                        try:
-                            await client.send_text(message)
-                        except:
-                            pass
+    """Remove client from room and notify whoever is left."""
+    room = rooms.get(room_id)
+    if room is None:
+        return
+
+    peer = room.peers.get(getattr(websocket.state, "peer_id", None))
+    # Peer IDs restart in a recreated room, so make sure the ID still refers to this socket.
+    if peer is None or peer.ws is not websocket:
+        return
+    global total_connections
+    del room.peers[peer.peer_id]
+    total_connections -= 1
+    # A removed peer neither receives nor relays anything more, even while its close is pending.
+    peer.dropped = True
+    peer.writer.cancel()
+    log_event(f"❌ Peer {peer.peer_id} left room {room_id} ({len(room.peers)}/4)")
+
+    if peer.peer_id == HOST_PEER_ID:
+        log_event(f"Host {peer.peer_id} disconnected from room {room_id}. Closing room.")
+        del rooms[room_id]
+        total_connections -= len(room.peers)
+        log_event(f"🧹 Room {room_id} deleted")
+        for survivor in room.peers.values():
+            survivor.dropped = True
+            survivor.writer.cancel()
+        await asyncio.gather(
+            *(
+                asyncio.wait_for(close_with_error(c.ws, "Host disconnected", room.codec), SEND_TIMEOUT)
+                for c in room.peers.values()
+            ),
+            return_exceptions=True,
+        )
+        return
+
+    # Cleanup empty room
+    if not room.peers:
+        del rooms[room_id]
+        log_event(f"🧹 Room {room_id} deleted")
+        return
+
+    # Notify others
+    msg = peer_notice("peer_disconnected", peer.peer_id, room.codec)
+    broadcast_to_room(room_id, msg)
+
+def is_object(payload: bytes, codec: str = JSON) -> bool:
+    """Whether a frame starts like a JSON object (or MessagePack map), judging by its first byte."""
+    if not payload:
+        return False
+    if codec == MSGPACK:
+        return 0x80 <= payload[0] <= 0x8f or payload[0] in MSGPACK_MAP_HEADERS
+    # JSON may start with whitespace, which json.loads (and clients) accept.
+    return payload[0] == 0x7b or payload.lstrip(JSON_WHITESPACE)[:1] == b"{"
+
+def message_type(payload: bytes, codec: str = JSON):
+    """Return the top-level "type" of a frame, or None.
+
+    Frames that do not start with a map/object are skipped without running the regex.
+    When "type" is the first key it is read straight from the bytes; otherwise the
+    frame is parsed, so a "type" nested inside another field is never mistaken for it.
+    """
+    if not is_object(payload, codec):
+        return None
+    if codec == MSGPACK:
+        match = MSGPACK_TYPE_RE.match(payload, 0, TYPE_SNIFF_BYTES)
+        if match:
+            start = match.end()
+            return payload[start:start + (match.group(1)[0] & 0x1f)]
+    else:
+        match = TYPE_RE.match(payload, 0, TYPE_SNIFF_BYTES)
+        if match:
+            return match.group(1)
+    try:
+        message = msgpack.unpackb(payload) if codec == MSGPACK else orjson.loads(payload)
+    except Exception:
+        return None
+    msg_type = message.get("type") if isinstance(message, dict) else None
+    return msg_type.encode() if isinstance(msg_type, str) else None
+
+def encode_batch(items: List[bytes], codec: str) -> bytes:
+    """Wrap already-encoded frames in a batch envelope without re-parsing them."""
+    if codec == MSGPACK:
+        size = len(items)
+        header = bytes([0x90 | size]) if size < 16 else b"\xdc" + size.to_bytes(2, "big")
+        return MSGPACK_BATCH_PREFIX + header + b"".join(items)
+    return b'{"type":"batch","items":[' + b",".join(items) + b"]}"
+
+def flush_candidates(peer: PeerRecord, batch: List[bytes] = None):
+    """Queue a peer's pending candidates together so its writer sends them as one batch.
+
+    The timer passes the `batch` it was armed for and only flushes if that batch is still pending.
+    """
+    pending = peer.pending_candidates
+    if pending is None or (batch is not None and pending is not batch):
+        return
+    peer.pending_candidates = None
+    for payload in pending:
+        enqueue(peer, payload, candidate=True)
+
+def deliver(peer: PeerRecord, payload: bytes, msg_type: bytes = None):
+    """Queue a relayed frame, coalescing ICE candidates for peers that opted in."""
+    batch = peer.pending_candidates
+    if msg_type == b"candidate" and peer.batching:
+        if batch is None:
+            batch = peer.pending_candidates = [payload]
+            asyncio.get_running_loop().call_later(
+                CANDIDATE_BATCH_WINDOW, flush_candidates, peer, batch
+            )
+            return
+        batch.append(payload)
+        if len(batch) >= CANDIDATE_BATCH_MAX:
+            flush_candidates(peer)
+        return
+    if batch is not None:
+        # Keep ordering: queued candidates go out before anything newer.
+        flush_candidates(peer)
+    enqueue(peer, payload, candidate=msg_type == b"candidate")
+
+def relay_message(payload: bytes, sender: PeerRecord, msg_type: bytes = None):
+    """Relay signaling messages between peers.
+
+    Routing depends only on who sent the frame, so the payload is forwarded untouched.
+    The receive loop passes its own PeerRecord, which also carries its Room, so no
+    lookup is needed to identify the sender or its room.
+    """
+    if sender.dropped:
+        return
+    room = sender.room
+    if sender.peer_id != HOST_PEER_ID: # Message from a client
+        host = room.peers.get(HOST_PEER_ID)
+        if host is not None:
+            deliver(host, payload, msg_type)
+    else: # Message from the host
+        for peer in room.peers.values():
+            if peer is not sender:
+                deliver(peer, payload, msg_type)
+
+
+async def iter_payloads(websocket: WebSocket) -> AsyncIterator[bytes]:
+    """Yield each frame as bytes, whether it was sent as text or binary, until the client disconnects.
+
+    Binary frames are passed through as-is, skipping UTF-8 decoding and re-encoding.
+    Like Starlette's iter_text(), it simply stops on disconnect instead of raising.
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message.get("bytes") is not None:
+            yield message["bytes"]
+        else:
+            yield message["text"].encode("utf-8")
 
 
 # FastAPI app
 app = FastAPI()
+STATUS_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "index.html")
 
 app.add_middleware(
     CORSMiddleware,
@@ -151,63 +475,26 @@ app.add_middleware(
 
 @app.get("/")
 async def root():
-    uptime = datetime.now() - server_start_time
-    hours = int(uptime.total_seconds() // 3600)
-    minutes = int((uptime.total_seconds() % 3600) // 60)
-    
-    room_info = ""
-    if rooms:
-        room_info = "<h3>Active Rooms:</h3><ul>"
-        for room_id, clients in rooms.items():
-            room_info += f"<li>Room <code>{room_id}</code>: {len(clients)}/4 players</li>"
-        room_info += "</ul>"
-    else:
-        room_info = "<p><em>No active rooms</em></p>"
-    
-    log_info = "<h3>Recent Events:</h3><ul>"
-    for log in reversed(connection_log[-15:]):
-        log_info += f"<li><code>{log}</code></li>"
-    log_info += "</ul>"
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>WebRTC Signaling Server (Star Topology)</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; max-width: 900px; margin: 0 auto; padding: 20px; background: #0f172a; color: #e2e8f0; }}
-            h1 {{ color: #60a5fa; }}
-            code {{ background: #1e293b; padding: 2px 6px; border-radius: 4px; color: #fbbf24; }}
-            .status {{ display: inline-block; padding: 8px 16px; background: #065f46; border-radius: 20px; color: #d1fae5; margin: 10px 0; }}
-            ul {{ background: #1e293b; padding: 15px 30px; border-radius: 8px; }}
-        </style>
-        <script>setTimeout(() => location.reload(), 3000);</script>
-    </head>
-    <body>
-        <h1>🎮 WebRTC Signaling Server</h1>
-        <div class="status">🟢 Server Online | Uptime: {hours}h {minutes}m</div>
-        
-        <h2>📊 Server Status</h2>
-        <p><strong>Active Rooms:</strong> {len(rooms)}</p>
-        <p><strong>Total Connections:</strong> {sum(len(c) for c in rooms.values())}</p>
-        {room_info}
-        {log_info}
-        
-        <h2>ℹ️ Architecture</h2>
-        <p><strong>Star Topology:</strong> Host (peer 1) relays all game data. Server only handles WebRTC signaling.</p>
-        <p><strong>WebSocket URL:</strong> <code>wss://web-services-nheh.onrender.com/ws/{{room_id}}/</code></p>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html)
+    """Dashboard shell; the page renders itself from /status."""
+    return FileResponse(STATUS_PAGE)
+
+@app.get("/status")
+async def status():
+    """Room list and recent events for the dashboard."""
+    return {
+        "uptime_seconds": time.monotonic() - server_start_time,
+        "rooms": [{"room_id": room_id, "players": len(room.peers)} for room_id, room in rooms.items()],
+        "events": list(islice(reversed(connection_log), 15)),
+    }
 
 @app.get("/health")
 async def health():
     return {
         "status": "healthy",
-        "uptime_seconds": (datetime.now() - server_start_time).total_seconds(),
+        "uptime_seconds": time.monotonic() - server_start_time,
         "active_rooms": len(rooms),
-        "total_connections": sum(len(c) for c in rooms.values())
+        "total_connections": total_connections,
+        "server_options": UVICORN_OPTIONS,
     }
 
 @app.websocket("/ws/{room_id}/")
@@ -215,37 +502,47 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
     """WebSocket endpoint for WebRTC signaling only."""
     peer_id = None
     try:
-        await websocket.accept()
-        log_event(f"🔌 Connection to room {room_id}")
+        codec = MSGPACK if MSGPACK in websocket.scope.get("subprotocols", ()) else JSON
+        await websocket.accept(subprotocol=MSGPACK if codec == MSGPACK else None)
+        log_event(f"🔌 Connection to room {room_id} ({codec})")
+
+        room = rooms.get(room_id)
+        if room is not None and room.codec != codec:
+            await close_with_error(websocket, f"Room uses {room.codec}", codec)
+            return
         
-        peer_id, is_host = await add_client_to_room(room_id, websocket)
+        batching = websocket.query_params.get("batch") == "1"
+        peer, is_host = add_client_to_room(room_id, websocket, codec, batching)
         
-        if peer_id is None:
-            await websocket.send_text(json.dumps({"type": "error", "message": "Room full"}))
-            await websocket.close()
+        if peer is None:
+            await close_with_error(websocket, "Room full", codec)
             return
+        peer_id = peer.peer_id
         
-        # Send welcome with peer ID
-        await websocket.send_text(json.dumps({
-            "type": "welcome",
-            "peer_id": peer_id,
-            "room_id": room_id,
-            "is_host": is_host
-        }))
+        # Send welcome with peer ID; it goes through the outbox so it precedes any relayed frame
+        enqueue(peer, welcome_frame(peer_id, room_id, is_host, codec))
         log_event(f"🎉 Peer {peer_id} welcomed (host={is_host})")
+
+        if not is_host:
+            msg = peer_notice("peer_joined", peer_id, codec)
+            broadcast_to_room(room_id, msg, exclude_client=websocket)
         
         # Message loop - relay signaling only
-        while True:
-            message = await websocket.receive_text()
-            data = json.loads(message)
-            if data.get("type") == "join":
+        async for payload in iter_payloads(websocket):
+            if peer.dropped:
+                # Already removed from the room (e.g. dropped for stalling); its close may
+                # not complete until the client acknowledges it, so stop reading now.
+                break
+            msg_type = message_type(payload, codec)
+            if msg_type == b"join":
                 continue
-            await relay_message(room_id, message, websocket)
+            relay_message(payload, peer, msg_type)
+        log_event(f"🔌 Peer {peer_id} disconnected")
     
     except WebSocketDisconnect:
         log_event(f"🔌 Peer {peer_id} disconnected")
     except Exception as e:
-        log_event(f"❌ Error for peer {peer_id}: {e}")
+        log_event(f"❌ Error for peer {peer_id}: {e}", logging.ERROR)
     finally:
         if peer_id:
             await remove_client_from_room(room_id, websocket)
@@ -255,4 +552,4 @@ log_event("🚀 Star topology signaling server ready")
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 10000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, **UVICORN_OPTIONS)